@@ -1,64 +1,233 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import argparse,csv,json,logging,os,queue,signal,sys,threading,time
+import argparse,csv,io,json,logging,mmap,os,re,signal,sys,threading,time
+from array import array
+from concurrent.futures import Future,ThreadPoolExecutor,wait
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from json.encoder import encode_basestring
 from pathlib import Path
-from typing import Iterable,Optional,Dict,Any
+from typing import BinaryIO,Callable,Iterable,Optional,Dict,Any,List,Set,Tuple
 try:
     from watchdog.observers import Observer
     from watchdog.events import FileSystemEventHandler
     HAVE_WATCHDOG=True
 except Exception:
     HAVE_WATCHDOG=False
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    HAVE_PYARROW=True
+except Exception:
+    HAVE_PYARROW=False
+try:
+    import orjson
+    HAVE_ORJSON=True
+except Exception:
+    HAVE_ORJSON=False
 TEMP_SUFFIXES={".tmp",".partial",".part",".crdownload"}
 TEMP_PREFIXES={".~","~$","."}
 CSV_EXTENSIONS={".csv"}
+_TEMP_RE=re.compile(r"^(?:%s)|(?:%s)\Z"%("|".join(map(re.escape,TEMP_PREFIXES)),"|".join(map(re.escape,TEMP_SUFFIXES))))
+WRITE_BUFFER_BYTES=1<<20
+ROW_BATCH_SIZE=4096
+DIRECT_READ_BYTES=1<<20
+READ_BUFFER_BYTES=1<<20
+ONE_SHOT_DECODE_BYTES=64<<20
+def _is_temp_name(name:str)->bool:
+    return _TEMP_RE.search(name) is not None
+def _is_csv_name(name:str)->bool:
+    # Slice instead of Path.suffix; the length check keeps a bare ".csv" (no stem) out, as suffix did
+    return len(name)>4 and name[-4:].lower() in CSV_EXTENSIONS
 def is_probably_temp(path:Path)->bool:
-    name=path.name
-    if any(name.startswith(p) for p in TEMP_PREFIXES):return True
-    if any(name.endswith(suf) for suf in TEMP_SUFFIXES):return True
-    return False
+    return _is_temp_name(path.name)
 def is_csv(path:Path)->bool:
-    return path.suffix.lower() in CSV_EXTENSIONS
+    return _is_csv_name(path.name)
+def positional_rows(rows:Iterable[List[str]])->Iterable[Dict[str,str]]:
+    # col1..colN keys are built once and only grown when a wider row shows up
+    keys:List[str]=[]
+    for row in rows:
+        if len(row)>len(keys):keys+=[f"col{i+1}" for i in range(len(keys),len(row))]
+        yield dict(zip(keys,row))
+def batched(rows:Iterable[Any],size:int=ROW_BATCH_SIZE)->Iterable[List[Any]]:
+    it=iter(rows)
+    while True:
+        batch=list(islice(it,size))
+        if not batch:return
+        yield batch
+def first_record(stream:BinaryIO,encoding:str,delimiter:str,quotechar:str)->Optional[List[str]]:
+    # Decodes only as far as the first record ends, however long it is, unlike a fixed-size sample
+    with io.TextIOWrapper(stream,encoding=encoding,newline="") as text:
+        return next(csv.reader(text,delimiter=delimiter,quotechar=quotechar),None)
+def quick_sniff(sample:bytes)->Optional[Tuple[str,str]]:
+    # Byte histogram over the usual delimiters. The winner is trusted only if it occurs in the header and
+    # equally often on every complete line of the sample; anything else is left to csv.Sniffer
+    counts={d:sample.count(d) for d in b",;\t|"}
+    delim=max(counts,key=counts.__getitem__)
+    lines=sample.split(b"\n")[:-1]
+    if not lines:return None
+    per_line=lines[0].count(delim)
+    if not per_line or any(line.count(delim)!=per_line for line in lines[1:]):return None
+    return chr(delim),'"'
+class DirectReader(io.RawIOBase):
+    # Sequential O_DIRECT reads through one page-aligned buffer (an anonymous mmap); can only rewind to 0
+    def __init__(self,path:Path):
+        super().__init__();self._fd=-1;self._buf=mmap.mmap(-1,DIRECT_READ_BYTES);self._start=self._end=self._pos=0;self._eof=False
+        self._fd=os.open(path,os.O_RDONLY|os.O_DIRECT)
+    def readable(self)->bool:return True
+    def seekable(self)->bool:return True
+    def tell(self)->int:return self._pos
+    def seek(self,offset:int,whence:int=io.SEEK_SET)->int:
+        if whence==io.SEEK_CUR and offset==0:return self._pos
+        if whence!=io.SEEK_SET or offset!=0:raise io.UnsupportedOperation("DirectReader can only rewind to the start")
+        os.lseek(self._fd,0,os.SEEK_SET);self._start=self._end=self._pos=0;self._eof=False;return 0
+    def readinto(self,b:Any)->int:
+        if self._start==self._end:
+            if self._eof:return 0
+            n=os.readv(self._fd,[self._buf]);self._start=0;self._end=n
+            # Only the last read is short; reading on from its unaligned offset would fail with EINVAL
+            self._eof=n<DIRECT_READ_BYTES
+            if not n:return 0
+        n=min(len(b),self._end-self._start)
+        with memoryview(self._buf) as view:b[:n]=view[self._start:self._start+n]
+        self._start+=n;self._pos+=n;return n
+    def close(self):
+        if not self.closed:
+            if self._fd>=0:os.close(self._fd);self._fd=-1
+            self._buf.close()
+        super().close()
+def read_direct_head(path:Path,size:int=4096)->Optional[bytes]:
+    # Also probes O_DIRECT support: platforms/filesystems without it (e.g. tmpfs) give None
+    if not hasattr(os,"O_DIRECT"):return None
+    try:
+        with DirectReader(path) as raw:return raw.read(size)
+    except OSError as e:
+        logging.debug("O_DIRECT read of %s failed (%s); using buffered IO",path,e);return None
+@lru_cache(maxsize=64)
+def schema_template(fieldnames:Tuple[str,...])->str:
+    # json.dumps' default layout with the header's keys pre-escaped; values fill the %s slots
+    return "{"+", ".join(encode_basestring(k).replace("%","%%")+": %s" for k in fieldnames)+"}"
+def dict_reader_row(fieldnames:Tuple[str,...],row:List[str])->Dict[Any,Any]:
+    # Same padding as csv.DictReader: extras under the None key, missing fields as None
+    d:Dict[Any,Any]=dict(zip(fieldnames,row));n=len(fieldnames)
+    if len(row)>n:d[None]=row[n:]
+    else:
+        for k in fieldnames[len(row):]:d[k]=None
+    return d
+def write_all(fd:int,data:bytearray)->None:
+    off=0;n=len(data)
+    with memoryview(data) as view:
+        while off<n:off+=os.write(fd,view[off:])
+def open_tmpfile(directory:Path)->Optional[int]:
+    # Linux only: an unnamed inode in the output dir, invisible to watchers until linked in
+    if not hasattr(os,"O_TMPFILE") or not os.path.isdir("/proc/self/fd"):return None
+    try:return os.open(directory,os.O_TMPFILE|os.O_WRONLY,0o666)
+    except OSError:return None
+def link_tmpfile(fd:int,out_path:Path)->None:
+    # dst_dir_fd makes os.link use linkat(AT_SYMLINK_FOLLOW), required to link a /proc fd
+    src=f"/proc/self/fd/{fd}";dir_fd=os.open(out_path.parent,os.O_RDONLY|os.O_DIRECTORY)
+    try:
+        try:os.link(src,out_path.name,dst_dir_fd=dir_fd)
+        except FileExistsError:
+            tmp_name=out_path.name+".tmp"
+            try:os.unlink(tmp_name,dir_fd=dir_fd)
+            except FileNotFoundError:pass
+            os.link(src,tmp_name,dst_dir_fd=dir_fd);os.replace(tmp_name,out_path.name,src_dir_fd=dir_fd,dst_dir_fd=dir_fd)
+    finally:os.close(dir_fd)
+class ConversionCancelled(Exception):
+    pass
 @dataclass
 class Config:
-    watch_dir:Path;out_dir:Path;recursive:bool;process_existing:bool;json_lines:bool;overwrite:bool;indent:Optional[int];delimiter:Optional[str];quotechar:Optional[str];encoding:str;debounce_sec:float=1.25;poll_interval:float=2.0
+    watch_dir:Path;out_dir:Path;recursive:bool;process_existing:bool;json_lines:bool;overwrite:bool;indent:Optional[int];delimiter:Optional[str];quotechar:Optional[str];encoding:str;debounce_sec:float=1.25;poll_interval:float=2.0;odirect:bool=False
 class Debouncer:
     def __init__(self,delay_sec:float,action):
-        self.delay=delay_sec;self.action=action;self._timers:Dict[Path,threading.Timer]={};self._lock=threading.Lock()
+        self.delay=delay_sec;self.action=action;self._cond=threading.Condition();self._thread=threading.Thread(target=self._run,daemon=True)
+        # Parallel arrays (path i is due at deadline i); N is small so linear scans beat a dict of objects
+        self._paths:List[Path]=[];self._deadlines=array("d");self._thread.start()
     def trigger(self,path:Path):
-        with self._lock:
-            t=self._timers.get(path)
-            if t is not None:t.cancel()
-            timer=threading.Timer(self.delay,self._run,args=(path,));self._timers[path]=timer;timer.daemon=True;timer.start()
-    def _run(self,path:Path):
-        with self._lock:self._timers.pop(path,None)
-        self.action(path)
+        with self._cond:
+            deadline=time.monotonic()+self.delay
+            try:self._deadlines[self._paths.index(path)]=deadline
+            except ValueError:self._paths.append(path);self._deadlines.append(deadline)
+            self._cond.notify()
+    def cancel(self,path:Path):
+        with self._cond:
+            try:i=self._paths.index(path)
+            except ValueError:return
+            del self._paths[i];del self._deadlines[i]
+    def _run(self):
+        # One dispatcher thread sleeps until the earliest deadline instead of a Timer thread per event
+        while True:
+            with self._cond:
+                while True:
+                    now=time.monotonic();earliest=min(self._deadlines) if self._deadlines else None
+                    if earliest is not None and earliest<=now:break
+                    self._cond.wait(timeout=None if earliest is None else earliest-now)
+                due=[p for p,d in zip(self._paths,self._deadlines) if d<=now]
+                keep=[i for i,d in enumerate(self._deadlines) if d>now]
+                self._paths=[self._paths[i] for i in keep];self._deadlines=array("d",[self._deadlines[i] for i in keep])
+            for p in due:
+                try:self.action(p)
+                except Exception:logging.exception("Debounced action failed for %s",p)
 class Converter:
     def __init__(self,cfg:Config):
-        self.cfg=cfg;self._work_q:"queue.Queue[Path]"=queue.Queue();self._stop=threading.Event();self._worker=threading.Thread(target=self._worker_main,daemon=True);self._worker.start()
-    def enqueue(self,path:Path):
-        if not is_csv(path)or is_probably_temp(path)or not path.exists():return
-        self._work_q.put(path)
-    def stop(self):
-        self._stop.set();self._work_q.put(None);self._worker.join(timeout=5)
-    def _worker_main(self):
-        while not self._stop.is_set():
-            try:item=self._work_q.get(timeout=0.5)
-            except queue.Empty:continue
-            if item is None:break
-            path:Path=item
-            try:
-                if not self._wait_stable(path,window=0.6,checks=3):
-                    logging.warning("File never stabilized; skipping: %s",path);continue
-                self._convert_file(path)
-            except Exception as e:logging.exception("Failed to convert %s: %s",path,e)
+        self.cfg=cfg;self._stop=threading.Event();workers=min(os.cpu_count() or 4,8)
+        self._pool=ThreadPoolExecutor(max_workers=workers,thread_name_prefix="csv-conv");self._slots=threading.BoundedSemaphore(workers*4)
+        self._lock=threading.Lock();self._running:Set[Path]=set();self._queued:Dict[Path,bool]={};self._futures:"Set[Future[None]]"=set()
+        self._dialect_cache:Dict[Path,Tuple[str,str]]={}
+    def enqueue(self,path:Path,already_closed:bool=False):
+        if not is_csv(path)or is_probably_temp(path)or not path.exists()or self._stop.is_set():return
+        # Per-path serial token. Events for a path whose run hasn't started yet fold into that run (it
+        # reads the file afterwards anyway); events during a run collapse into one follow-up run
+        with self._lock:
+            if path in self._queued:self._queued[path]=self._queued[path] and already_closed;return
+            self._queued[path]=already_closed
+            if path in self._running:return
+            self._running.add(path)
+        self._dispatch(path)
+    def stop(self,timeout:float=5.0):
+        # Running conversions notice _stop at their next row batch; don't wait on them past the timeout
+        self._stop.set();self._pool.shutdown(wait=False)
+        with self._lock:futures=list(self._futures)
+        wait(futures,timeout=timeout)
+    def _dispatch(self,path:Path):
+        # Bounded backlog; when full the producer converts the file itself (caller-runs) and so slows down
+        if not self._slots.acquire(blocking=False):self._run_serial(path,False);return
+        try:fut=self._pool.submit(self._run_serial,path,True)
+        except RuntimeError:
+            self._slots.release()
+            with self._lock:self._running.discard(path);self._queued.pop(path,None)
+            return
+        with self._lock:self._futures.add(fut)
+        fut.add_done_callback(self._forget)
+    def _forget(self,fut:"Future[None]"):
+        with self._lock:self._futures.discard(fut)
+    def _run_serial(self,path:Path,holds_slot:bool):
+        try:
+            # Whatever was folded in up to now is covered by this run; later events queue a follow-up
+            with self._lock:already_closed=self._queued.pop(path,True)
+            if not self._stop.is_set():self._process(path,already_closed)
+        finally:
+            if holds_slot:self._slots.release()
+        with self._lock:
+            if path not in self._queued or self._stop.is_set():self._running.discard(path);self._queued.pop(path,None);return
+        self._dispatch(path)
+    def _process(self,path:Path,already_closed:bool):
+        try:
+            # A close-after-write (or rename into place) already means the writer is done
+            if not already_closed and not self._wait_stable(path,window=0.6,checks=3):
+                if not self._stop.is_set():logging.warning("File never stabilized; skipping: %s",path)
+                return
+            self._convert_file(path)
+        except ConversionCancelled:logging.info("Conversion of %s cancelled by shutdown",path)
+        except Exception as e:logging.exception("Failed to convert %s: %s",path,e)
     def _wait_stable(self,path:Path,window:float,checks:int)->bool:
         try:last=path.stat().st_size
         except FileNotFoundError:return False
         stable=0
         for _ in range(checks*2):
-            time.sleep(window)
+            if self._stop.wait(window):return False
             try:size=path.stat().st_size
             except FileNotFoundError:return False
             if size==last:
@@ -80,84 +249,180 @@ class Converter:
         out_path=self.cfg.out_dir/out_name
         out_path=self._unique_out_path(out_path)
         out_path.parent.mkdir(parents=True,exist_ok=True)
-        tmp_path=out_path.with_suffix(out_path.suffix+".tmp")
-        with open(csv_path,"r",encoding=self.cfg.encoding,newline="") as f:
-            sample=f.read(4096);f.seek(0);dialect=None
-            if not self.cfg.delimiter:
+        head=read_direct_head(csv_path) if self.cfg.odirect else None
+        direct=head is not None
+        if head is None:
+            with open(csv_path,"rb") as raw:head=raw.read(4096)
+        sample=head.decode(self.cfg.encoding,"replace");dialect=None;cached=None
+        if not self.cfg.delimiter:
+            # Sniff once per source directory; later files there reuse the detected dialect
+            # unless its delimiter is absent from their first line
+            cached=self._dialect_cache.get(csv_path.parent)
+            if cached is not None and cached[0] not in sample.partition("\n")[0]:cached=None
+            if cached is None:cached=quick_sniff(head)
+            if cached is not None:self._dialect_cache[csv_path.parent]=cached
+            else:
                 try:dialect=csv.Sniffer().sniff(sample)
                 except Exception:pass
-            # Set delimiter and quotechar with proper fallbacks
-            if self.cfg.delimiter:
-                delimiter = self.cfg.delimiter
-            elif dialect:
-                delimiter = getattr(dialect, "delimiter", ",")
-            else:
-                delimiter = ","
-            
-            if self.cfg.quotechar:
-                quotechar = self.cfg.quotechar
-            elif dialect:
-                quotechar = getattr(dialect, "quotechar", '"')
-            else:
-                quotechar = '"'
-            
-            reader_kwargs = {"delimiter": delimiter, "quotechar": quotechar}
+                else:self._dialect_cache[csv_path.parent]=(dialect.delimiter,dialect.quotechar)
+        # Set delimiter and quotechar with proper fallbacks
+        if self.cfg.delimiter:
+            delimiter = self.cfg.delimiter
+        elif cached:
+            delimiter = cached[0]
+        elif dialect:
+            delimiter = getattr(dialect, "delimiter", ",")
+        else:
+            delimiter = ","
+        
+        if self.cfg.quotechar:
+            quotechar = self.cfg.quotechar
+        elif cached:
+            quotechar = cached[1]
+        elif dialect:
+            quotechar = getattr(dialect, "quotechar", '"')
+        else:
+            quotechar = '"'
+        
+        reader_kwargs = {"delimiter": delimiter, "quotechar": quotechar}
+        if HAVE_PYARROW and head:
             try:
-                dict_reader=csv.DictReader(f,**reader_kwargs);fieldnames=dict_reader.fieldnames
-                if not fieldnames or any(h is None or str(h).strip()=="" for h in fieldnames):raise ValueError("No valid header row detected")
-                rows_iter:Iterable[Dict[str,Any]]=({k:v for k,v in row.items()} for row in dict_reader)
-                self._write_json(rows_iter,tmp_path)
-            except Exception:
-                f.seek(0);rdr=csv.reader(f,**reader_kwargs)
-                rows_iter2:Iterable[Dict[str,Any]]=({f"col{idx+1}":val for idx,val in enumerate(row)} for row in rdr)
-                self._write_json(rows_iter2,tmp_path)
-        os.replace(tmp_path,out_path);logging.info("Wrote %s",out_path)
-    def _write_json(self,rows:Iterable[Dict[str,Any]],tmp_path:Path):
-        if self.cfg.json_lines:
-            with open(tmp_path,"w",encoding="utf-8") as out:
-                for row in rows:out.write(json.dumps(row,ensure_ascii=False));out.write("\n")
+                header=first_record(self._open_binary(csv_path,direct),self.cfg.encoding,delimiter,quotechar)
+                # pyarrow streams the file itself in block_size chunks; O_DIRECT input goes through DirectReader
+                with (self._open_binary(csv_path,direct) if direct else pa.OSFile(str(csv_path))) as source:
+                    self._write_output(self._arrow_batches(source,header,delimiter,quotechar),out_path)
+                logging.info("Wrote %s",out_path);return
+            except pa.ArrowInvalid as e:
+                logging.debug("pyarrow could not parse %s (%s); falling back to csv module",csv_path,e)
+        # Decode files up to ONE_SHOT_DECODE_BYTES in one pass rather than chunk by chunk through a TextIOWrapper;
+        # larger (and O_DIRECT) input is streamed so the decoded text never sits in memory whole
+        raw=self._open_binary(csv_path,direct)
+        if direct or os.fstat(raw.fileno()).st_size>ONE_SHOT_DECODE_BYTES:f:Any=io.TextIOWrapper(raw,encoding=self.cfg.encoding,newline="")
         else:
-            with open(tmp_path,"w",encoding="utf-8") as out:
-                out.write("[");first=True
-                for row in rows:
-                    if not first:out.write(",")
-                    else:first=False
-                    obj=json.dumps(row,ensure_ascii=False,indent=self.cfg.indent)
-                    out.write(obj)
-                out.write("]")
+            with raw:f=io.StringIO(str(raw.read(),self.cfg.encoding),newline="")
+        with f:self._convert_text(f,reader_kwargs,out_path)
+        logging.info("Wrote %s",out_path)
+    def _convert_text(self,f:Any,reader_kwargs:Dict[str,str],out_path:Path):
+        try:
+            dict_reader=csv.DictReader(f,**reader_kwargs);fieldnames=dict_reader.fieldnames
+            if not fieldnames or any(h is None or str(h).strip()=="" for h in fieldnames):raise ValueError("No valid header row detected")
+            row_encoder=self._schema_encoder(tuple(fieldnames))
+            if row_encoder is not None:
+                # Raw csv rows (blank lines skipped, as DictReader does) straight into the schema template
+                self._write_output(batched(filter(None,dict_reader.reader)),out_path,row_encoder)
+            else:
+                self._write_output(batched(dict_reader),out_path)
+        except Exception:
+            f.seek(0);rdr=csv.reader(f,**reader_kwargs)
+            rows_iter2:Iterable[Dict[str,Any]]=positional_rows(rdr)
+            self._write_output(batched(rows_iter2),out_path)
+    def _open_binary(self,csv_path:Path,direct:bool)->BinaryIO:
+        if direct:return io.BufferedReader(DirectReader(csv_path),DIRECT_READ_BYTES)
+        # Plain buffered reads rather than a mapping: a writer truncating the file under an mmap raises SIGBUS
+        raw=open(csv_path,"rb",buffering=READ_BUFFER_BYTES)
+        # The read is one sequential pass: widen readahead for the file
+        if hasattr(os,"posix_fadvise"):os.posix_fadvise(raw.fileno(),0,0,os.POSIX_FADV_SEQUENTIAL)
+        return raw
+    def _arrow_batches(self,source:Any,header:Optional[List[str]],delimiter:str,quotechar:str)->Iterable[List[Dict[str,Any]]]:
+        if header is None:return
+        # Header-less output keeps blank lines as {} rows, which pyarrow can't express: leave those to the csv module
+        if not header or not all(h.strip() for h in header):raise pa.ArrowInvalid("no valid header row detected")
+        # Column names are fixed up front so every column stays a string (no type inference);
+        # skip_rows_after_names counts parsed records, so a header with a quoted newline is skipped whole
+        read_opts=pacsv.ReadOptions(block_size=1<<20,encoding=self.cfg.encoding,column_names=header,skip_rows_after_names=1)
+        parse_opts=pacsv.ParseOptions(delimiter=delimiter,quote_char=quotechar,newlines_in_values=True)
+        convert_opts=pacsv.ConvertOptions(column_types={n:pa.string() for n in header},strings_can_be_null=False)
+        reader=pacsv.open_csv(source,read_options=read_opts,parse_options=parse_opts,convert_options=convert_opts)
+        while True:
+            try:batch=reader.read_next_batch()
+            except StopIteration:break
+            if batch.num_rows:yield batch.to_pylist()
+    def _json_encoder(self)->Callable[[Any],bytes]:
+        indent=None if self.cfg.json_lines else self.cfg.indent
+        # orjson only knows compact and 2-space output; other indents use the stdlib encoder
+        if HAVE_ORJSON and indent in (None,2):
+            option=orjson.OPT_NON_STR_KEYS|(orjson.OPT_INDENT_2 if indent else 0)
+            return lambda row:orjson.dumps(row,option=option)
+        return lambda row:json.dumps(row,ensure_ascii=False,indent=indent).encode("utf-8")
+    def _schema_encoder(self,fieldnames:Tuple[str,...])->Optional[Callable[[List[str]],bytes]]:
+        # Only pays off against the stdlib encoder; orjson on a dict is faster than per-field formatting
+        indent=None if self.cfg.json_lines else self.cfg.indent
+        if HAVE_ORJSON or indent is not None or len(set(fieldnames))!=len(fieldnames):return None
+        template=schema_template(fieldnames);n=len(fieldnames);fallback=self._json_encoder()
+        def encode(row:List[str])->bytes:
+            if len(row)==n:return (template%tuple(map(encode_basestring,row))).encode("utf-8")
+            return fallback(dict_reader_row(fieldnames,row))
+        return encode
+    def _write_output(self,batches:Iterable[List[Any]],out_path:Path,encode:Optional[Callable[[Any],bytes]]=None):
+        fd=open_tmpfile(out_path.parent)
+        if fd is None:
+            tmp_path=out_path.with_suffix(out_path.suffix+".tmp")
+            fd=os.open(tmp_path,os.O_WRONLY|os.O_CREAT|os.O_TRUNC|getattr(os,"O_BINARY",0),0o666)
+            try:self._write_json(batches,fd,encode)
+            except BaseException:
+                os.close(fd);tmp_path.unlink();raise
+            os.close(fd);os.replace(tmp_path,out_path);return
+        try:self._write_json(batches,fd,encode);link_tmpfile(fd,out_path)
+        finally:os.close(fd)
+    def _write_json(self,batches:Iterable[List[Any]],fd:int,encode:Optional[Callable[[Any],bytes]]=None):
+        encode=encode or self._json_encoder()
+        # One join per row batch; output accumulates to ~1 MiB and is flushed with os.write
+        buf=bytearray();first=True
+        if not self.cfg.json_lines:buf+=b"["
+        for batch in batches:
+            if self._stop.is_set():raise ConversionCancelled()
+            if self.cfg.json_lines:buf+=b"\n".join(map(encode,batch));buf+=b"\n"
+            else:
+                if not first:buf+=b","
+                buf+=b",".join(map(encode,batch));first=False
+            if len(buf)>=WRITE_BUFFER_BYTES:write_all(fd,buf);buf.clear()
+        if not self.cfg.json_lines:buf+=b"]"
+        if buf:write_all(fd,buf)
 if HAVE_WATCHDOG:
     class _WatchdogHandler(FileSystemEventHandler):
         def __init__(self,cfg:Config,conv:Converter,debouncer:Debouncer):
             super().__init__();self.cfg=cfg;self.conv=conv;self.debouncer=debouncer
         def on_created(self,event):self._maybe_handle(event)
         def on_modified(self,event):self._maybe_handle(event)
-        def _maybe_handle(self,event):
+        def on_closed(self,event):self._maybe_handle(event,closed=True)
+        def on_moved(self,event):self._maybe_handle(event,src_path=event.dest_path,closed=True)
+        def _maybe_handle(self,event,src_path:Optional[str]=None,closed:bool=False):
             try:
                 if getattr(event,"is_directory",False):return
-                path=Path(event.src_path)
+                path=Path(src_path or event.src_path)
                 if not is_csv(path):return
-                self.debouncer.trigger(path)
+                if closed:self.debouncer.cancel(path);self.conv.enqueue(path,already_closed=True)
+                else:self.debouncer.trigger(path)
             except Exception:logging.exception("Event handling failed")
 class _PollingWatcher:
     def __init__(self,cfg:Config,conv:Converter):
-        self.cfg=cfg;self.conv=conv;self._seen:Dict[Path,float]={};self._stop=threading.Event();self._thread=threading.Thread(target=self._run,daemon=True)
+        self.cfg=cfg;self.conv=conv;self._seen:Dict[str,int]={};self._stop=threading.Event();self._thread=threading.Thread(target=self._run,daemon=True)
     def start(self):self._thread.start()
     def stop(self):self._stop.set();self._thread.join(timeout=5)
     def _run(self):
         logging.warning("watchdog not installed; using polling every %.1fs",self.cfg.poll_interval)
         while not self._stop.is_set():
-            for p in self._scan_csvs():
-                try:mtime=p.stat().st_mtime
-                except FileNotFoundError:continue
-                last=self._seen.get(p)
-                if last is None or mtime>last:
-                    self._seen[p]=mtime;self.conv.enqueue(p)
+            for path,mtime_ns in self._scan_csvs():
+                if self._seen.get(path,-1)<mtime_ns:
+                    self._seen[path]=mtime_ns;self.conv.enqueue(Path(path))
             time.sleep(self.cfg.poll_interval)
-    def _scan_csvs(self)->Iterable[Path]:
-        root=self.cfg.watch_dir
-        it=root.rglob("*.csv") if self.cfg.recursive else root.glob("*.csv")
-        for p in it:
-            if not is_probably_temp(p):yield p
+    def _scan_csvs(self)->Iterable[Tuple[str,int]]:
+        # Explicit-stack scandir walk: names are filtered before any Path or stat is created
+        stack=[str(self.cfg.watch_dir)]
+        while stack:
+            try:it=os.scandir(stack.pop())
+            except OSError:continue
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.cfg.recursive:stack.append(entry.path)
+                            continue
+                        if not _is_csv_name(entry.name) or _is_temp_name(entry.name):continue
+                        mtime_ns=entry.stat().st_mtime_ns
+                    except OSError:continue
+                    # Keyed by path so a renamed or moved file is picked up under its new name
+                    yield entry.path,mtime_ns
 def parse_args(argv:Optional[Iterable[str]]=None)->Config:
     ap=argparse.ArgumentParser(description="Watch a directory for CSV files and convert them to JSON.")
     ap.add_argument("--watch",required=True,help="Directory to watch for CSV files")
@@ -170,13 +435,14 @@ def parse_args(argv:Optional[Iterable[str]]=None)->Config:
     ap.add_argument("--delimiter",default=None,help="CSV delimiter (default: auto-sniff, then ',')")
     ap.add_argument("--quotechar",default=None,help="CSV quote character (default: auto-sniff, then double-quote)")
     ap.add_argument("--encoding",default="utf-8-sig",help="Input file encoding (default: utf-8-sig)")
+    ap.add_argument("--odirect",action="store_true",help="Stream CSVs with O_DIRECT in 1 MiB reads, bypassing the page cache (Linux)")
     ap.add_argument("--log",default="INFO",help="Log level (DEBUG, INFO, WARNING, ERROR)")
     ns=ap.parse_args(argv)
     watch_dir=Path(ns.watch).expanduser().resolve()
     out_dir=Path(ns.out).expanduser().resolve() if ns.out else watch_dir
     if not watch_dir.exists() or not watch_dir.is_dir():ap.error(f"--watch path is not a directory: {watch_dir}")
     logging.basicConfig(level=getattr(logging,str(ns.log).upper(),logging.INFO),format="%(asctime)s %(levelname)s %(message)s",datefmt="%H:%M:%S")
-    return Config(watch_dir=watch_dir,out_dir=out_dir,recursive=bool(ns.recursive),process_existing=bool(ns.process_existing),json_lines=bool(ns.jsonl),overwrite=bool(ns.overwrite),indent=ns.indent,delimiter=ns.delimiter,quotechar=ns.quotechar,encoding=ns.encoding)
+    return Config(watch_dir=watch_dir,out_dir=out_dir,recursive=bool(ns.recursive),process_existing=bool(ns.process_existing),json_lines=bool(ns.jsonl),overwrite=bool(ns.overwrite),indent=ns.indent,delimiter=ns.delimiter,quotechar=ns.quotechar,encoding=ns.encoding,odirect=bool(ns.odirect))
 def process_existing(cfg:Config,conv:Converter):
     def emit(p:Path):
         if p.is_file() and is_csv(p) and not is_probably_temp(p):conv.enqueue(p)